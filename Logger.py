@@ -13,6 +13,20 @@ def systemLogFile(logfileName):
     return fh
 
 class Logger():
+    # recent messages of all modules, (logger name, msg), newest first.
+    # shared so that memory use doesn't grow with the number of modules.
+    _messages = deque(maxlen=100)
+
+    @staticmethod
+    def setMessageRingSize(size):
+        "resize the shared message ring, keep the newest messages."
+        Logger._messages = deque(list(Logger._messages)[:size], maxlen=size)
+
+    @property
+    def msgDeque(self):
+        "recent messages of this module, newest first."
+        return [msg for name, msg in Logger._messages if name == self.logName]
+
     def debug(self, x): return 0
     def info(self, x): return 0
     def warning(self, x): return 0
@@ -22,9 +36,7 @@ class Logger():
     def __init__(self,saveName, logLevel='DEBUG', printMessages = True,fileHandler=None, **kwargs):
         self.PRINT_MESSAGES = printMessages
         self.LOG_LEVEL = logLevel
-
-        # to store messages.
-        self.msgDeque = deque(maxlen=100)
+        self.logName = saveName
         
         self.init_logger(saveName,fileHandler)
     
@@ -43,7 +55,7 @@ class Logger():
             def wrap(msg,error=None):
                 "possibly send msg to a stream for display elsewhere."
                 print(msg)
-                self.msgDeque.appendleft(msg)
+                Logger._messages.appendleft((self.logName, msg))
                 return func(msg)
             return wrap
 
@@ -0,0 +1,227 @@
+"""
+Time based animations for LED modes.
+An Animation returns the colors of every LED in a zone for an elapsed time t in seconds,
+so the output doesn't depend on the frame rate: FPS can change at runtime and a slow
+frame skips ahead instead of stretching the animation.
+Random choices are drawn from generators seeded by (seed, cycle index), so the same
+seed gives the same animation for any t.
+"""
+import math
+import random
+from bisect import bisect_right
+
+# easing curves, map progress 0 - 1 to 0 - 1.
+def linear(x): return x
+def easeInQuad(x): return x * x
+def easeOutQuad(x): return x * (2 - x)
+def easeInOutQuad(x): return 2 * x * x if x < 0.5 else 1 - 2 * (1 - x) ** 2
+def easeInOutSine(x): return 0.5 - 0.5 * math.cos(math.pi * x)
+
+EASING = {
+    'linear': linear,
+    'easeInQuad': easeInQuad,
+    'easeOutQuad': easeOutQuad,
+    'easeInOutQuad': easeInOutQuad,
+    'easeInOutSine': easeInOutSine,
+}
+
+
+class Color(tuple):
+    "immutable rgb color. intern() returns one shared object per value, used for named colors."
+    __slots__ = ()
+    _interned = {}
+
+    def __new__(cls, r=0, g=0, b=0):
+        return tuple.__new__(cls, (r, g, b))
+
+    @classmethod
+    def intern(cls, r=0, g=0, b=0):
+        color = cls._interned.get((r, g, b))
+        if color is None:
+            color = cls._interned[(r, g, b)] = cls(r, g, b)
+        return color
+
+
+BLACK = Color.intern(0, 0, 0)
+
+
+def lerp(a, b, x, out=None):
+    "interpolate color a to b, x in 0 - 1, into out if given."
+    if out is None:
+        return [ai + (bi - ai) * x for ai, bi in zip(a, b)]
+    for i, (ai, bi) in enumerate(zip(a, b)):
+        out[i] = ai + (bi - ai) * x
+    return out
+
+
+def rng(seed, *keys):
+    "random generator for a seed and cycle index, same arguments give the same sequence."
+    return random.Random(':'.join(str(i) for i in (seed,) + keys))
+
+
+def play(animation, clock):
+    "adapt an animation to the frame generator interface, sampled at clock() since start."
+    start = clock()
+    while 1:
+        yield animation.sample(clock() - start)
+
+
+class Animation():
+    """
+    Base class. Subclass implement sample(t) -> [color of each LED].
+    duration is the length of one play through, math.inf if it never ends.
+    The returned list may be a buffer reused by the next sample, so a frame
+    doesn't allocate new lists: read it before sampling again, or copy it.
+    """
+    duration = math.inf
+
+    def sample(self, t):
+        raise NotImplementedError
+
+    def sampleMany(self, times):
+        "sample a batch of timestamps, return a list of frames."
+        return [[tuple(c) for c in self.sample(t)] for t in times]
+
+
+class Hold(Animation):
+    "keep the same colors for duration seconds."
+    def __init__(self, colors, duration=math.inf):
+        self.colors = list(colors)
+        self.duration = duration
+
+    def sample(self, t):
+        return self.colors
+
+
+class Keyframes(Animation):
+    """
+    Interpolate between keyframes [(time, [color of each LED]), ...],
+    times in seconds, ascending, starting at 0.
+    easing is applied to every segment between two keyframes.
+    """
+    def __init__(self, keyframes, easing=linear, loop=False):
+        self.times = [k[0] for k in keyframes]
+        self.frames = [list(k[1]) for k in keyframes]
+        self.easing = EASING.get(easing, easing) if isinstance(easing, str) else easing
+        self.loop = loop
+        self.duration = math.inf if loop else self.times[-1]
+        # interpolated colors are written here.
+        self.out = [[0, 0, 0] for _ in self.frames[0]]
+
+    def sample(self, t):
+        end = self.times[-1]
+        if self.loop and end > 0:
+            t = t % end
+        if t <= self.times[0]:
+            return self.frames[0]
+        if t >= end:
+            return self.frames[-1]
+        i = bisect_right(self.times, t) - 1
+        t0, t1 = self.times[i], self.times[i + 1]
+        x = self.easing((t - t0) / (t1 - t0))
+        for out, a, b in zip(self.out, self.frames[i], self.frames[i + 1]):
+            lerp(a, b, x, out)
+        return self.out
+
+
+class Repeat(Animation):
+    "play a finite animation times times."
+    def __init__(self, animation, times=1):
+        self.animation = animation
+        self.duration = animation.duration * times
+
+    def sample(self, t):
+        t = min(max(t, 0), self.duration)
+        if t == self.duration:
+            return self.animation.sample(self.animation.duration)
+        return self.animation.sample(t % self.animation.duration)
+
+
+class Clip(Animation):
+    "duration seconds of animation, starting from offset."
+    def __init__(self, animation, offset=0, duration=1):
+        self.animation = animation
+        self.offset = offset
+        self.duration = duration
+
+    def sample(self, t):
+        return self.animation.sample(self.offset + min(max(t, 0), self.duration))
+
+
+class Sequence(Animation):
+    """
+    Play animations made by factory(index) one after another, forever.
+    Every animation must have a finite duration, and factory must return the
+    same animation for the same index, so that any t can be sampled.
+    Only the current segment is kept: moving forward in time is cheap,
+    sampling before it replays the segments from the start.
+    """
+    def __init__(self, factory):
+        self.factory = factory
+        self.index = 0
+        self.start = 0
+        self.current = None
+
+    def segment(self, index):
+        animation = self.factory(index)
+        if not 0 < animation.duration < math.inf:
+            raise ValueError(f'Sequence segment duration {animation.duration} invalid')
+        return animation
+
+    def sample(self, t):
+        t = max(t, 0)
+        if self.current is None or t < self.start:
+            self.index, self.start = 0, 0
+            self.current = self.segment(0)
+        while t >= self.start + self.current.duration:
+            self.start += self.current.duration
+            self.index += 1
+            self.current = self.segment(self.index)
+        return self.current.sample(t - self.start)
+
+
+def breath(colors, duration=1, end=None, hold=0, easing=linear):
+    """
+    breath from end to colors, then back to end, over duration seconds,
+    then keep end colors for hold seconds.
+    """
+    end = end or [BLACK] * len(colors)
+    keyframes = [(0, end), (duration / 2, colors), (duration, end)]
+    if hold:
+        keyframes.append((duration + hold, end))
+    return Keyframes(keyframes, easing=easing)
+
+
+def blink(colorsAt, length, on=0.1, off=0.15):
+    "blink, colorsAt(cycle) returns the colors of each on phase, off phase is dark."
+    dark = [BLACK] * length
+    return Sequence(lambda i: Hold(colorsAt(i // 2), on) if i % 2 == 0 else Hold(dark, off))
+
+
+class Wheel(Animation):
+    """
+    onCount LEDs lit with colorAt(t), moving one LED every moveTime seconds.
+    stays one step past the last LED before starting over.
+    """
+    def __init__(self, length, colorAt, onCount=2, moveTime=0.1):
+        self.length = length
+        self.colorAt = colorAt
+        self.onCount = onCount
+        self.moveTime = moveTime
+        self.state = [BLACK] * length
+
+    def sample(self, t):
+        current = int(max(t, 0) / self.moveTime) % (self.length + 1)
+        color = self.colorAt(t)
+        state = self.state
+        for i in range(self.length):
+            state[i] = BLACK
+        for i in range(current, current + self.onCount):
+            state[i % self.length] = color
+        return state
+
+
+def colorDrift(colorAt, transitionTime=0.5):
+    "return f(t) -> color, moving from colorAt(i) to colorAt(i+1) every transitionTime seconds."
+    drift = Sequence(lambda i: Keyframes([(0, [colorAt(i)]), (transitionTime, [colorAt(i + 1)])]))
+    return lambda t: drift.sample(t)[0]
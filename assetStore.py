@@ -0,0 +1,161 @@
+"""
+Static asset store used by the http server.
+Every file under the asset folder is held in memory as a single copy: the gzip
+compressed bytes if that is smaller, otherwise the file as is. Clients that
+don't accept gzip, rare for a phone browser, get it decompressed on request.
+Files changed on disk are picked up by comparing mtime, and the new copy
+replaces the old asset as a whole, so body and ETag always match.
+"""
+import os
+import gzip
+import time
+import hashlib
+import mimetypes
+from pathlib import Path
+from email.utils import formatdate, parsedate_to_datetime
+
+
+class Asset():
+    """
+    One static file.
+    Only one variant is kept: gz if compression makes the file smaller, else raw.
+    """
+    def __init__(self, data, mtime, contentType, mtime_ns=0, size=0):
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.contentType = contentType
+        self.etag = '"' + hashlib.md5(data).hexdigest()[:16] + '"'
+        self.mtime = int(mtime)
+        self.lastModified = formatdate(self.mtime, usegmt=True)
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        if len(compressed) < len(data):
+            self.raw, self.gz = None, compressed
+        else:
+            self.raw, self.gz = data, None
+        # strong validators differ between content codings.
+        self.gzEtag = self.etag[:-1] + '-gz"' if self.gz is not None else None
+
+    @classmethod
+    def fromFile(cls, fp):
+        "read a file from disk, the file isn't kept open or mapped."
+        with open(fp, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            data = f.read()
+        contentType = mimetypes.guess_type(str(fp))[0] or 'application/json'
+        return cls(data, stat.st_mtime, contentType, stat.st_mtime_ns, stat.st_size)
+
+    @classmethod
+    def fromBytes(cls, data, mtime, contentType):
+        "build an asset from generated content, e.g. rendered templates."
+        return cls(data, mtime, contentType)
+
+    def encoding(self, acceptEncoding=''):
+        "return the content-encoding to send for the Accept-Encoding header, 'gzip' or None."
+        return 'gzip' if self.gz is not None and acceptsGzip(acceptEncoding) else None
+
+    def etagFor(self, encoding=None):
+        "ETag of the body sent with encoding."
+        return self.gzEtag if encoding == 'gzip' else self.etag
+
+    def body(self, acceptEncoding=''):
+        "return (bytes, content-encoding or None) best for the Accept-Encoding header."
+        encoding = self.encoding(acceptEncoding)
+        if encoding:
+            return self.gz, encoding
+        if self.gz is None:
+            return self.raw, None
+        return gzip.decompress(self.gz), None
+
+    def notModified(self, ifNoneMatch=None, ifModifiedSince=None):
+        "return true if the client copy is still valid, in either content-encoding."
+        if ifNoneMatch:
+            tags = [i.strip() for i in ifNoneMatch.split(',')]
+            tags = [i[2:] if i.startswith('W/') else i for i in tags]
+            return '*' in tags or self.etag in tags or (self.gzEtag is not None and self.gzEtag in tags)
+        if ifModifiedSince:
+            try:
+                return parsedate_to_datetime(ifModifiedSince).timestamp() >= self.mtime
+            except (TypeError, ValueError):
+                return False
+        return False
+
+
+def acceptsGzip(acceptEncoding):
+    """
+    parse Accept-Encoding header, return true if gzip is acceptable.
+    An explicit gzip entry wins over *.
+    """
+    qualities = {}
+    for item in (acceptEncoding or '').split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if coding not in ('gzip', '*') or coding in qualities:
+            continue
+        q = params.strip()
+        try:
+            qualities[coding] = float(q[2:]) if q.startswith('q=') else 1
+        except ValueError:
+            qualities[coding] = 0
+    return qualities.get('gzip', qualities.get('*', 0)) > 0
+
+
+class AssetStore():
+    """
+    Holds all files under folder, keyed by relative path.
+    Paths in exclude, e.g. templates read by their renderer, are not loaded.
+    """
+    def __init__(self, folder='./html', checkInterval=1, logger=None, exclude=()):
+        self.folder = Path(folder)
+        self.exclude = set(exclude)
+        self.checkInterval = checkInterval
+        self.logger = logger
+        self.assets = {}
+        self.lastCheck = 0
+        self.refresh(force=True)
+
+    def __len__(self):
+        return len(self.assets)
+
+    def keys(self):
+        return self.assets.keys()
+
+    def get(self, path, default=None):
+        "return the Asset at relative path, reload it first if it changed on disk."
+        self.refresh()
+        return self.assets.get(path, default)
+
+    def refresh(self, force=False):
+        """
+        reload changed files, add new ones and drop removed ones.
+        only stats the folder once every checkInterval seconds.
+        return list of reloaded paths.
+        """
+        now = time.monotonic()
+        if not force and now - self.lastCheck < self.checkInterval:
+            return []
+        self.lastCheck = now
+        seen = set()
+        reloaded = []
+        for root, _, files in os.walk(self.folder):
+            for file in files:
+                fp = Path(root) / file
+                relative_path = fp.relative_to(self.folder).as_posix()
+                if relative_path in self.exclude:
+                    continue
+                seen.add(relative_path)
+                try:
+                    stat = fp.stat()
+                    current = self.assets.get(relative_path)
+                    if current and current.mtime_ns == stat.st_mtime_ns and current.size == stat.st_size:
+                        continue
+                    self.assets[relative_path] = Asset.fromFile(fp)
+                    reloaded.append(relative_path)
+                except OSError as e:
+                    if self.logger:
+                        self.logger.error(f"Load asset {relative_path} error: {e}")
+        for removed in set(self.assets) - seen:
+            # old copy is released when no response is using it anymore.
+            del self.assets[removed]
+        if reloaded and self.logger and not force:
+            self.logger.debug(f"Reloaded assets: {reloaded}")
+        return reloaded
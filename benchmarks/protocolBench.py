@@ -0,0 +1,66 @@
+"""
+Compare json and binary websocket protocol: CPU of parse / dispatch / encode
+per command, and bytes on the wire including websocket frame header.
+Run on the Pi: python benchmarks/protocolBench.py [iterations]
+"""
+import sys
+import json
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from ledControl import MODES
+from wsProtocol import BinaryCodec
+
+def frameBytes(payload, fromClient):
+    "websocket frame size for a small payload, client frames are masked."
+    header = 2 if len(payload) < 126 else 4
+    return header + (4 if fromClient else 0) + len(payload)
+
+def dispatch(msg):
+    "stand in for ClientModule.messageHandler, without running the action."
+    action = msg.pop('action', None)
+    return {'status': 'ok', 'data': None, 'action': action}
+
+def main(iterations=100000):
+    codec = BinaryCodec(MODES)
+    mode = codec.modeNames[-1]
+    jsonRequest = json.dumps({'action': 'led.show', 'mode': mode})
+    binaryRequest = codec.encodeMode(1, mode)
+    # same keys as LEDControl.state()
+    state = {'eye': codec.modeNames[0], 'ring': mode, 'eyeSeed': 3735928559, 'ringSeed': 123456789,
+             'brightness': 70, 'fullrandom': False, 'fullrandomDuration': 20.0, 'fps': 24.0}
+
+    def jsonRoundTrip():
+        response = dispatch(json.loads(jsonRequest))
+        return json.dumps(response, separators=(',', ':'))
+
+    def binaryRoundTrip():
+        seq, opcode, msg = codec.decode(binaryRequest)
+        return codec.encodeResponse(seq, opcode, dispatch(msg))
+
+    jsonResponse = jsonRoundTrip()
+    binaryResponse = binaryRoundTrip()
+    def jsonState():
+        return json.dumps({'topic': 'state', 'data': state}, separators=(',', ':'))
+
+    def binaryState():
+        return codec.encodeEvent('state', state)
+
+    jsonEvent = jsonState()
+    binaryEvent = binaryState()
+
+    print(f'{"":<18}{"json":>10}{"binary":>10}')
+    for name, functions in (('command us', (jsonRoundTrip, binaryRoundTrip)), ('state event us', (jsonState, binaryState))):
+        t = [timeit.timeit(f, number=iterations) / iterations * 1e6 for f in functions]
+        print(f'{name:<18}{t[0]:>10.2f}{t[1]:>10.2f}')
+    rows = [
+        ('request bytes', frameBytes(jsonRequest.encode(), True), frameBytes(binaryRequest, True)),
+        ('response bytes', frameBytes(jsonResponse.encode(), False), frameBytes(binaryResponse, False)),
+        ('state event bytes', frameBytes(jsonEvent.encode(), False), frameBytes(binaryEvent, False)),
+    ]
+    for name, j, b in rows:
+        print(f'{name:<18}{j:>10}{b:>10}')
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -1,9 +1,15 @@
 
 
 
+// binary protocol, see wsProtocol.py
+const BINARY_PROTOCOL = 'bucket.bin.v1'
+const OP_MODE = 0x01
+
 class App {
     constructor () {
-        this.ws = new WebSocket(websocketAddr);
+        this.seq = 0
+        this.ws = new WebSocket(websocketAddr, [BINARY_PROTOCOL, 'bucket.json']);
+        this.ws.binaryType = 'arraybuffer'
         this.ws.onopen = () => {
             console.log('connected');
             this.addEventListener()
@@ -27,16 +33,30 @@ class App {
         return false;
       }
 
+    sendMode(button) {
+        if (this.ws && this.ws.readyState == 1 && this.ws.protocol == BINARY_PROTOCOL) {
+          const msg = new DataView(new ArrayBuffer(4))
+          this.seq = (this.seq + 1) % 256
+          msg.setUint8(0, OP_MODE)
+          msg.setUint8(1, this.seq)
+          msg.setUint16(2, Number(button.dataset.modeId), true)
+          this.ws.send(msg.buffer)
+          console.log('send mode:', button.id)
+          return true;
+        }
+        return this.send({
+            action:'led.show',
+            mode: button.id
+        })
+      }
+
     addEventListener (){
 
       const buttons = document.getElementsByTagName('button')
       for (let button of buttons){
           button.disabled = false
         button.addEventListener('click', (e) => {            
-            this.send({
-                action:'led.show',
-                mode: e.target.id
-            })
+            this.sendMode(e.currentTarget)
 
         })
       }
@@ -44,4 +64,36 @@ class App {
     }
 }
 
-const app = new App()
\ No newline at end of file
+// animated previews, rendered by renderPreviews.py:
+// one png row per frame, one pixel per LED.
+function showPreviews() {
+    fetch('previews/manifest.json').then(res => res.ok ? res.json() : {}).then(manifest => {
+        for (const mode in manifest) {
+            const button = document.getElementById(mode)
+            if (!button) continue
+            const {file, fps, frames, leds} = manifest[mode]
+            const img = new Image()
+            img.onload = () => {
+                const canvas = document.createElement('canvas')
+                canvas.width = leds * 8
+                canvas.height = 8
+                canvas.style.display = 'block'
+                canvas.style.margin = '4px auto 0'
+                button.appendChild(canvas)
+                const ctx = canvas.getContext('2d')
+                ctx.imageSmoothingEnabled = false
+                const start = performance.now()
+                const draw = (now) => {
+                    const row = Math.floor((now - start) / 1000 * fps) % frames
+                    ctx.drawImage(img, 0, row, leds, 1, 0, 0, canvas.width, canvas.height)
+                    requestAnimationFrame(draw)
+                }
+                requestAnimationFrame(draw)
+            }
+            img.src = 'previews/' + file
+        }
+    }).catch(err => console.log('no previews', err))
+}
+
+const app = new App()
+showPreviews()
\ No newline at end of file
@@ -1,12 +1,17 @@
 from threading import Thread
 from http.server import HTTPServer,BaseHTTPRequestHandler
-from jinja2 import Template
 import sys
-import json,os
+import json
 from pathlib import Path
-import mimetypes
 from Logger import Logger
+from assetStore import AssetStore,Asset
 from ledControl import MODES
+from wsProtocol import modeIds
+
+# rendered by renderPage, not served as files.
+TEMPLATES = ['index.html']
+# written by renderPreviews.py
+PREVIEW_MANIFEST = 'previews/manifest.json'
 
 def handler(Master):
     class SimpleHandler(BaseHTTPRequestHandler):
@@ -28,12 +33,42 @@ def handler(Master):
         def sendData(self,data,header,cache=True):
             self.send_response(200)
             self.send_header("Content-type", header)
+            self.send_header("Content-Length", str(len(data)))
+            self.sendCacheControl(cache)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def sendCacheControl(self,cache=True):
             # FIXME: remove dev testing.
-            if (sys.argv[-1] != '-dev'):
+            if '-dev' not in sys.argv:
                 if cache:
                     self.send_header("Cache-Control","public, max-age=432000")
+                else:
+                    # always revalidate with ETag.
+                    self.send_header("Cache-Control","no-cache")
+
+        def sendAsset(self,asset,cache=True):
+            "send an Asset, use gzip variant if accepted, answer 304 if client copy is valid."
+            if asset.notModified(self.headers['If-None-Match'],self.headers['If-Modified-Since']):
+                self.send_response(304)
+                self.send_header("ETag", asset.etagFor(asset.encoding(self.headers['Accept-Encoding'])))
+                self.send_header("Last-Modified", asset.lastModified)
+                self.sendCacheControl(cache)
+                self.end_headers()
+                return
+            body,encoding = asset.body(self.headers['Accept-Encoding'])
+            self.send_response(200)
+            self.send_header("Content-type", asset.contentType)
+            self.send_header("Content-Length", str(len(body)))
+            if encoding:
+                self.send_header("Content-Encoding", encoding)
+            if asset.gz is not None:
+                self.send_header("Vary", "Accept-Encoding")
+            self.send_header("ETag", asset.etagFor(encoding))
+            self.send_header("Last-Modified", asset.lastModified)
+            self.sendCacheControl(cache)
             self.end_headers()
-            self.wfile.write(data)
+            self.wfile.write(body)
 
         def sendCSS(self,css):
             self.sendData(css,'text/css')
@@ -50,22 +85,23 @@ def handler(Master):
             # self.logger.main.peripheral.led.show('wifi',[50,1],1,)
             path = self.path.strip('/') or 'index.html'
             if path == 'index.html':
-                self.sendHTML(self.render('index.html',EYE=MODES['eye'],RING=MODES['ring']))
+                page = self.render('index.html',EYE=MODES['eye'],RING=MODES['ring'],MODE_IDS=modeIds(MODES))
+                if page:
+                    # page embeds positional mode ids, revalidate so it never outlives a MODES change.
+                    return self.sendAsset(page,cache=False)
+                return self.abort404()
             else:
                 self.sendFileOr404(path)
         
         def render(self,filepath,*args,**kwargs):
-            "render with jinja2"           
-            if self.logger.resources.get(filepath,None):
-                template = self.logger.resources.get(filepath)
-                return Template(template.decode()).render(*args,**kwargs).encode()
-            return "Page Not Found.".encode()
+            "render with jinja2, return an Asset or None"
+            return self.logger.renderPage(filepath,*args,**kwargs)
 
         def sendFileOr404(self,filePath,mode='html'):
-            header = mimetypes.guess_type(filePath)[0] or 'application/json'
-            if self.logger.resources.get(filePath,None):
-                data = self.logger.resources.get(filePath)
-                return self.sendData(data,header)
+            asset = self.logger.resources.get(filePath,None)
+            if asset:
+                # preview strips are named by content hash, their manifest changes in place.
+                return self.sendAsset(asset,cache=filePath != PREVIEW_MANIFEST)
             return self.abort404()
 
     return SimpleHandler
@@ -83,15 +119,34 @@ class HttpServerModule(Thread,Logger):
 
     def initialize(self,**kwargs):
 
-        # load all resources from templates folder to self.resources        
-        self.resources = {}
-        for root,_,files in os.walk('./html'):
-            for file in files:
-                fp = os.path.join(root,file)
-                relative_path = str(Path(fp).relative_to('./html'))
-                with open(fp,'rb') as f:
-                    self.resources[relative_path] = f.read()
+        # one in memory copy of each file in html folder, changed files are reloaded on request.
+        # templates are read from disk when rendered, only the rendered page is kept.
+        self.resources = AssetStore('./html',logger=self,exclude=TEMPLATES)
+        # rendered pages, keyed by template path, stored with (mtime_ns, size) of the template.
+        self.renderCache = {}
         self.debug(f"Loaded {len(self.resources)} resources. {list(self.resources.keys())}")
+
+    def renderPage(self,filepath,*args,**kwargs):
+        """
+        render template with jinja2, return an Asset.
+        The rendered page is cached until the template changes, so context should be
+        constant for the same template (MODES is fixed after import).
+        """
+        fp = Path('./html') / filepath
+        try:
+            stat = fp.stat()
+        except OSError:
+            return None
+        key = (stat.st_mtime_ns,stat.st_size)
+        cached = self.renderCache.get(filepath,None)
+        if cached and cached[0] == key:
+            return cached[1]
+        # jinja2 is only loaded when a page is first rendered.
+        from jinja2 import Template
+        html = Template(fp.read_text()).render(*args,**kwargs).encode()
+        page = Asset.fromBytes(html,stat.st_mtime,'text/html')
+        self.renderCache[filepath] = (key,page)
+        return page
         
     def run(self):        
         self.httpServer = None
@@ -1,16 +1,32 @@
 from threading import Thread
-
-from websockets import framing
 from Logger import Logger
-import board
-import busio
-import adafruit_tlc59711
 from time import perf_counter as timer
 import time
+import math
 import random
+from collections import deque
+from concurrent.futures import Future
+from pathlib import Path
+from stateStore import StateStore
+from animation import Color,BLACK,Animation,Sequence,Repeat,Clip,Wheel,play,rng,breath,blink,colorDrift
 
 MODES = {'eye':[],'ring':[]}
 
+class Frame():
+    "16 bit pixel values of one frame, allocated once and refilled every tick."
+    __slots__ = ('values',)
+
+    def __init__(self,size):
+        self.values = [[0,0,0] for _ in range(size)]
+
+    def fill(self,start,colors,scale):
+        "write 0 - 255 colors scaled by scale, from index start."
+        for i,c in enumerate(colors,start):
+            v = self.values[i]
+            v[0] = max(0,min(int(c[0]*scale),65535))
+            v[1] = max(0,min(int(c[1]*scale),65535))
+            v[2] = max(0,min(int(c[2]*scale),65535))
+
 def registerMode(buttonName):    
     def deco(func):
         if func.__name__.startswith('eye'):
@@ -35,33 +51,61 @@ class LEDControl(Thread,Logger):
     _ORDER = [1,2,3,6,7,4,5, # ring order
                 8,9,10,11] # eye order
     _NAMED_COLOR = {
-            'red':[255,0,0],
-            'green':[0,255,0],
-            'blue':[0,0,255],
-            'yellow':[255,255,0],
-            'cyan':[0,255,255],
-            'purple':[255,0,255],
-            'white':[255,255,255],
-            'black':[0,0,0],
-            'orange':[255,165,0],            
-            'pink':[255,192,203],
-            'brown':[165,42,42],            
+            'red':Color.intern(255,0,0),
+            'green':Color.intern(0,255,0),
+            'blue':Color.intern(0,0,255),
+            'yellow':Color.intern(255,255,0),
+            'cyan':Color.intern(0,255,255),
+            'purple':Color.intern(255,0,255),
+            'white':Color.intern(255,255,255),
+            'black':Color.intern(0,0,0),
+            'orange':Color.intern(255,165,0),            
+            'pink':Color.intern(255,192,203),
+            'brown':Color.intern(165,42,42),            
         }
     _COLOR_NAMES = ['red','green','blue','yellow','cyan','purple','white','orange','pink','brown']
-    def __init__(self,main):
+    def __init__(self,main,pixels=None,persist=True):
+        """
+        pixels: output with set_pixel / show, default the TLC59711 driver.
+        persist: restore and save state snapshot, off for headless rendering.
+        """
         self.main = main
         super().__init__(daemon=True)
         Logger.__init__(self,'LED',fileHandler = self.main.fileHandler)
-        spi = busio.SPI(board.SCK, MOSI=board.MOSI)
-        self.pixels = adafruit_tlc59711.TLC59711(spi, pixel_count=12)
+        self.pixels = pixels if pixels is not None else self.initPixels()
+        self.frame = Frame(len(self._ORDER))
+        # output of a zone without a mode, shared by every frame.
+        self.ringDark = [BLACK]*len(self._RING_ORDER)
+        self.eyeDark = [BLACK]*len(self._EYE_ORDER)
         self._FPS = 24     
+        self.frameTime = timer()
         self.ringGenerator = None
         self.eyeGenerator = None
+        self.ringMode = None
+        self.eyeMode = None
+        # seeds of the current modes' random generators.
+        self.ringSeed = None
+        self.eyeSeed = None
         self.brightness = 70 # between 0 - 100
         self.fullrandom=True
         self.fullrandomDuration = 20 # seconds
-        self.randomModeSelect()
+        # (func, Future) to run in the LED thread before the next frame.
+        self.frameTasks = deque()
+        # set while a batch is applied, stateChanged is called once when it ends.
+        self.deferState = False
+        self.stateStore = StateStore(Path(__file__).parent / 'state.json',logger=self) if persist else None
+        snapshot = self.stateStore.load() if persist else None
+        if not (snapshot and self.restore(snapshot)):
+            self.randomModeSelect()
     
+    def initPixels(self):
+        "TLC59711 driver, hardware libraries are only imported here."
+        import board
+        import busio
+        import adafruit_tlc59711
+        spi = busio.SPI(board.SCK, MOSI=board.MOSI)
+        return adafruit_tlc59711.TLC59711(spi, pixel_count=12)
+
     @property
     def eyeLength(self):
         return len(self._EYE_ORDER)
@@ -69,247 +113,285 @@ class LEDControl(Thread,Logger):
     def ringLength(self):
         return len(self._RING_ORDER)
 
-    def frames(self,duration=1):
-        return int(duration*self._FPS)
-
-    def color(self,name=None):
-        "return a named color"
+    def color(self,name=None,rng=random):
+        "return a named color, a random one picked with rng if no name"
         if not name:
-            name = random.choice(self._COLOR_NAMES)            
-        return self._NAMED_COLOR.get(name,[0,0,0])
-
-    def randColor(self):
-        return [random.randint(0,255) for _ in range(3)]
-
-    def show(self,mode=''):
+            name = rng.choice(self._COLOR_NAMES)            
+        return self._NAMED_COLOR.get(name,BLACK)
+
+    def randColor(self,rng=random):
+        return [rng.randint(0,255) for _ in range(3)]
+
+    def newSeed(self,seed=None):
+        "seed for a mode's random generators"
+        return random.getrandbits(32) if seed is None else seed
+
+    def frameClock(self):
+        "time of the current frame, animations are sampled at this time."
+        return self.frameTime
+
+    def setFPS(self,fps=24):
+        "change frame rate, animations keep their speed."
+        fps = float(fps)
+        if not 1 <= fps <= 200:
+            raise ValueError(f'FPS {fps} not in 1 - 200')
+        self._FPS = fps
+        self.stateChanged()
+        return self._FPS
+
+    def runAtFrame(self,func):
+        "run func() in LED thread at the next frame boundary, return a Future of its result."
+        future = Future()
+        self.frameTasks.append((func,future))
+        return future
+
+    def runFrameTasks(self):
+        "run all pending frame tasks, so their changes land on the same frame."
+        while self.frameTasks:
+            func,future = self.frameTasks.popleft()
+            try:
+                future.set_result(func())
+            except Exception as e:
+                future.set_exception(e)
+
+    def setBrightness(self,brightness=70):
+        "set eye and ring brightness, 0 - 100"
+        brightness = int(brightness)
+        if not 0 <= brightness <= 100:
+            raise ValueError(f'Brightness {brightness} not in 0 - 100')
+        self.brightness = brightness
+        self.stateChanged()
+        return self.brightness
+
+    def setFullRandom(self,on=True,duration=20):
+        "turn on / off switching to a random mode every duration seconds."
+        duration = float(duration)
+        # nan would never switch, nan / inf aren't valid json for state.json and clients.
+        if not math.isfinite(duration) or duration <= 0:
+            raise ValueError(f'Full random duration {duration} must be a positive number')
+        self.fullrandom = bool(on)
+        self.fullrandomDuration = duration
+        self.stateChanged()
+        return self.fullrandom
+
+    def modeGenerator(self,mode,seed=None):
+        "return frame generator of a mode, animations are sampled at the frame time."
+        result = getattr(self,mode)(seed=seed)
+        if isinstance(result,Animation):
+            return play(result,self.frameClock)
+        return result
+
+    def show(self,mode='',seed=None):
+        "show a mode, seed its random generators with seed, or a new random seed."
         self.debug(f'Showing LED mode {mode}')
         if mode == 'eyeFullRandomON':
             self.fullrandom=True
+            self.stateChanged()
             return
+        self.setMode(mode,seed)
         self.fullrandom=False
+        self.stateChanged()
+
+    def setMode(self,mode,seed=None):
+        "replace the generator of mode's zone, raise ValueError if mode is not registered."
+        if mode not in [name for _,name in MODES['eye'] + MODES['ring']]:
+            raise ValueError(f'LED mode {mode} not found')
+        seed = self.newSeed(seed)
         if mode.startswith('eye'):
-            self.eyeGenerator = getattr(self,mode,lambda x:None)()
+            self.eyeGenerator = self.modeGenerator(mode,seed)
+            self.eyeMode,self.eyeSeed = mode,seed
         elif mode.startswith('ring'):
-            self.ringGenerator = getattr(self,mode,lambda x:None)()
-        else:
-            self.debug(f'LED mode {mode} not found')
+            self.ringGenerator = self.modeGenerator(mode,seed)
+            self.ringMode,self.ringSeed = mode,seed
+
+    def state(self):
+        "current modes and settings"
+        return {'eye':self.eyeMode,'ring':self.ringMode,'eyeSeed':self.eyeSeed,'ringSeed':self.ringSeed,
+                'brightness':self.brightness,'fullrandom':self.fullrandom,
+                'fullrandomDuration':self.fullrandomDuration,'fps':self._FPS}
+
+    def restore(self,state):
+        "restore modes and settings from a state() snapshot, return True if modes are restored."
+        try:
+            brightness = max(0,min(int(state.get('brightness',self.brightness)),100))
+            fps = float(state.get('fps',self._FPS))
+            duration = float(state.get('fullrandomDuration',self.fullrandomDuration))
+            if not (math.isfinite(fps) and math.isfinite(duration) and duration > 0):
+                raise ValueError(f'fps {fps} or full random duration {duration} invalid')
+            self.brightness = brightness
+            self._FPS = max(1,min(fps,200))
+            self.fullrandomDuration = duration
+            self.fullrandom = bool(state.get('fullrandom',self.fullrandom))
+            modes = [name for _,name in MODES['eye'] + MODES['ring']]
+            restored = False
+            for zone in ('eye','ring'):
+                mode = state.get(zone)
+                if mode in modes:
+                    seed = state.get(zone + 'Seed')
+                    # keep a mode that is already playing, instead of starting it over.
+                    if (mode,seed) != (getattr(self,zone + 'Mode'),getattr(self,zone + 'Seed')):
+                        self.setMode(mode,seed)
+                    restored = True
+            self.debug(f'Restored LED state {state}')
+            return restored
+        except (TypeError,ValueError) as e:
+            self.error(f'Restore LED state {state} error: {e}')
+            return False
+
+    def stateChanged(self,persist=True):
+        "snapshot state to disk if persist, and publish it to clients subscribed to the state topic."
+        if self.deferState:
+            return
+        if persist and self.stateStore is not None:
+            self.stateStore.save(self.state())
+        client = getattr(self.main,'client',None)
+        if client is not None:
+            client.publish('state',self.state())
 
     @registerMode('Random Blink')
-    def eyeBlinkRand(self):
+    def eyeBlinkSlowRand(self,seed=None):
         "eye blink"
-        state = 0
-        last = self._FPS / 2
-        eyc = [ self.randColor() for i in range(self.eyeLength)]
-        while 1:
-            if last:
-                yield eyc
-                last -= 1
-            if last == 0:
-                state = 1 if state == 0 else 0
-                last = self._FPS/2
-                if state:
-                    eyc = [ self.randColor() for i in range(self.eyeLength)]
-                else:
-                    eyc = [ [0,0,0] ] * self.eyeLength
+        seed = self.newSeed(seed)
+        return blink(lambda i: [self.randColor(rng(seed,i)) for _ in range(self.eyeLength)],
+                     self.eyeLength,on=0.5,off=0.5)
 
     @registerMode('Fast Blink')
-    def eyeBlinkRand(self):
+    def eyeBlinkRand(self,seed=None):
         "eye blink"
-        state = 1
-        last = self.frames(duration=0.1)
-        eyc = [ self.randColor() for i in range(self.eyeLength)]
-        while 1:
-            if last:
-                yield eyc
-                last -= 1
-            if last == 0:
-                state = 1 if state == 0 else 0                
-                if state:
-                    last = self.frames(duration=0.1)
-                    eyc = [ self.randColor() for i in range(self.eyeLength)]
-                else:
-                    last = self.frames(duration=0.15)
-                    eyc = [ [0,0,0] ] * self.eyeLength
+        seed = self.newSeed(seed)
+        return blink(lambda i: [self.randColor(rng(seed,i)) for _ in range(self.eyeLength)],
+                     self.eyeLength,on=0.1,off=0.15)
 
     @registerMode('Full random')
-    def eyeFullRandomON(self):
+    def eyeFullRandomON(self,seed=None):
         "random color"
         pass
     
     @registerMode('Random Breath')
-    def eyeBreathRand(self):
-        "eye breath"                
-        while 1:
-            eye  = [self.color() for i in range(self.eyeLength)]
-            for e in zip(*[self.breath(i,duration=1.8) for i in eye]):
-                yield e
-            # keep dark for 0.3 seconds
-            for _ in range(self.frames(duration = 0.5)):
-                yield [self.color('black')]* self.eyeLength
+    def eyeBreathRand(self,seed=None):
+        "eye breath"
+        seed = self.newSeed(seed)
+        def cycle(i):
+            r = rng(seed,i)
+            eye = [self.color(rng=r) for _ in range(self.eyeLength)]
+            # keep dark for 0.5 seconds
+            return breath(eye,duration=1.8,hold=0.5)
+        return Sequence(cycle)
 
     @registerMode('Twin Breath')
-    def eyeBreathTwinRand(self):
-        "eye breath"                
-        while 1:
-            c1 = self.color() 
-            c2 = self.color() 
-            eye  = [c1,c1,c2,c2]
-            for e in zip(*[self.breath(i,duration=1.8,end=[j*0.002 for j in i]) for i in eye]):
-                yield e
-            # keep dark for 0.3 seconds
-            for _ in range(self.frames(duration = 1)):
-                yield [[j*0.002 for j in i] for i in eye]
+    def eyeBreathTwinRand(self,seed=None):
+        "eye breath"
+        seed = self.newSeed(seed)
+        def cycle(i):
+            r = rng(seed,i)
+            c1 = self.color(rng=r)
+            c2 = self.color(rng=r)
+            eye = [c1,c1,c2,c2]
+            # keep dim for 1 second
+            return breath(eye,duration=1.8,end=[[j*0.002 for j in c] for c in eye],hold=1)
+        return Sequence(cycle)
     
     @registerMode('Cycle Breath')
-    def eyeBreathCycle(self):
-        "eye breath"                
-        while 1:
-            for color in ['red','green','blue','cyan','purple','white']:
-                # blink random times then change color 
-                for i in range(random.randint(1,5)):                                                
-                    eye  = [self.color(color) for i in range(self.eyeLength)]
-                    for e in zip(*[self.breath(i,duration=1.8) for i in eye]):
-                        yield e
-                    # keep dark for 0.3 seconds
-                    for _ in range(self.frames(duration = 0.5)):
-                        yield [self.color('black')]* self.eyeLength
+    def eyeBreathCycle(self,seed=None):
+        "eye breath"
+        seed = self.newSeed(seed)
+        colors = ['red','green','blue','cyan','purple','white']
+        def cycle(i):
+            # breath random times then change color
+            eye = [self.color(colors[i % len(colors)])] * self.eyeLength
+            return Repeat(breath(eye,duration=1.8,hold=0.5),rng(seed,i).randint(1,5))
+        return Sequence(cycle)
 
     @registerMode('Random Wheel')
-    def ringRandomWheel(self):
+    def ringRandomWheel(self,seed=None):
         "cycle ring"
-        current = 0
-        onCount = 2
-        moveTime = 0.1
-        transitionTime = 0.5
-        currentColor = self.color('green')
-        colorTransition = self.transition(self.color('white'),self.color('green'),transitionTime)
-        while 1:
-            newState = [self.color('black')] * self.ringLength
-            for i in range(current,current+onCount):
-                idx = i % self.ringLength
-                try:
-                    color = next(colorTransition)
-                except StopIteration:
-                    newColor = self.randColor()
-                    colorTransition = self.transition(currentColor,newColor,transitionTime)
-                    currentColor = newColor
-                    color = next(colorTransition)
-                newState[idx] = color
-            for i in range(self.frames(moveTime)):
-                yield newState            
-            current += 1
-            if current > self.ringLength:
-                current = 0
+        seed = self.newSeed(seed)
+        def colorAt(i):
+            # start from white to green, then random colors.
+            if i < 2:
+                return self.color(['white','green'][i])
+            return self.randColor(rng(seed,i))
+        return Wheel(self.ringLength,colorDrift(colorAt,transitionTime=0.5),onCount=2,moveTime=0.1)
 
     @registerMode('Blink Ring')
-    def ringBlink(self):
-        state = 0
-        last = self.frames(duration=0.1)
+    def ringBlink(self,seed=None):
         colors = ['red','green','blue','cyan','purple','white']
-        colrIdx = 0
-        eyc = [ self.color('red') for i in range(self.ringLength)]
-        while 1:
-            if last:
-                yield eyc
-                last -= 1
-            if last == 0:
-                state = 1 if state == 0 else 0
-                last = self.frames(duration=0.1) if state else self.frames(duration=0.15)
-                colrIdx = (colrIdx + 1) % len(colors)
-                if state:
-                    eyc = [ self.color(colors[colrIdx]) for i in range(self.ringLength)]
-                else:
-                    eyc = [ self.color('black') ] * self.ringLength
+        return blink(lambda i: [self.color(colors[i % len(colors)])] * self.ringLength,
+                     self.ringLength,on=0.1,off=0.15)
 
     @registerMode('Wheel Bink')
-    def ringWheelBlink(self):
-        wheel = self.ringRandomWheel()
-        blink = self.ringBlink()        
-        while 1:
-            for i in range(self.frames(duration=5)):
-                yield next(wheel)
-            for j in range(self.frames(duration=3)):
-                yield next(blink)
-            
-
+    def ringWheelBlink(self,seed=None):
+        wheel = self.ringRandomWheel(seed)
+        blinkRing = self.ringBlink(seed)
+        # 5 seconds of wheel then 3 seconds of blink, both continue where they left.
+        def cycle(i):
+            if i % 2 == 0:
+                return Clip(wheel,offset=i // 2 * 5,duration=5)
+            return Clip(blinkRing,offset=i // 2 * 3,duration=3)
+        return Sequence(cycle)
 
     @registerMode('Breath')
-    def ringBreathCycle(self):
+    def ringBreathCycle(self,seed=None):
+        seed = self.newSeed(seed)
         dimPercent = 0.03
-        while 1:
-            for color in ['red','green','blue','cyan','purple','white']:
-                # blink random times then change color 
-                for i in range(random.randint(1,3)):                                                
-                    ring  = [self.color(color) for i in range(self.ringLength)]
-                    for e in zip(*[self.breath(i,duration=1.8,end=[j*dimPercent for j in i]) for i in ring]):
-                        yield e
-                    # keep dark for 0.3 seconds
-                    for _ in range(self.frames(duration = 0.5)):
-                        yield [[j*dimPercent for j in i] for i in ring]
-
-
-    def transition(self,f,t,duration):
-        "transition from f to t, over duration seconds"
-        frames = self.frames(duration)
-        for i in range(frames):
-            yield [ fi + (ti-fi) / (frames-1) * i  for fi,ti in zip(f,t)]
-            
-
-    def breath(self,color=[255,255,255],duration=1,end=[0,0,0],):
-        "breath effect, from dark to color, then back to dark, total last for duration seconds"
-        yield from self.transition(end,color,duration/2)
-        yield from self.transition(color,end,duration/2)
-    
-        
-    
+        colors = ['red','green','blue','cyan','purple','white']
+        def cycle(i):
+            # breath random times then change color
+            ring = [self.color(colors[i % len(colors)])] * self.ringLength
+            dim = [[j*dimPercent for j in c] for c in ring]
+            return Repeat(breath(ring,duration=1.8,end=dim,hold=0.5),rng(seed,i).randint(1,3))
+        return Sequence(cycle)
+
     def getNextRingState(self):
         "return next ring state"
         if self.ringGenerator is None:
-            return [[0,0,0]]*(len(self._RING_ORDER))
+            return self.ringDark
         try:
             return next(self.ringGenerator)
         except StopIteration:
             self.ringGenerator = None
-            return [[0,0,0]]*(len(self._RING_ORDER))
+            return self.ringDark
 
 
     def getNextEyeState(self):
         "return next eye state"
         if self.eyeGenerator is None:
-            return [[0,0,0]]*(len(self._EYE_ORDER))
+            return self.eyeDark
         try:
             return next(self.eyeGenerator)
         except StopIteration:
             self.eyeGenerator = None
-            return [[0,0,0]]*(len(self._EYE_ORDER))
-
-    def Brightness(self,color,dim=False):
-        "adjust brightness, the color I will just use 0 - 255"
-        if dim:
-            brightness = self.brightness
-        else:
-            brightness = 100
-        return [max(0,min(int(65535/255*c*brightness/100),65535)) for c in color]
+            return self.eyeDark
 
     def randomModeSelect(self):
         "random mode select"
         eye = random.choice([i for i in MODES['eye'] if i[1]!='eyeFullRandomON'])[1]
         ring = random.choice(MODES['ring'])[1]
-        self.show(eye)
-        self.show(ring)
-
+        self.setMode(eye)
+        self.setMode(ring)
+        # modes picked by full random aren't worth an SD card write every fullrandomDuration.
+        self.stateChanged(persist=not self.fullrandom)
+
+
+    def renderFrame(self,frameTime):
+        "compute the frame at frameTime and write it to pixels."
+        self.frameTime = frameTime
+        self.runFrameTasks()
+        r = self.getNextRingState()
+        e = self.getNextEyeState()
+        # adjust brightness for ring and eye leds, into the reused frame buffer.
+        scale = 65535/255*self.brightness/100
+        self.frame.fill(0,r,scale)
+        self.frame.fill(len(r),e,scale)
+        for i,n in zip(self._ORDER,self.frame.values):
+            self.pixels.set_pixel(i,n)
+        self.pixels.show()
 
     def run(self):
         tStart = timer()
         while 1:
             t0 = timer()
-            r = self.getNextRingState()
-            e = self.getNextEyeState()
-            # only adjust brightness for the eyle leds
-            ns = [self.Brightness(n,dim=True) for n in r]  + [self.Brightness(n,dim=True) for n in e]
-            for i,n in zip(self._ORDER,ns):
-                self.pixels.set_pixel(i,n)
-            self.pixels.show()
+            self.renderFrame(t0)
             dt = timer()-t0
             if dt < 1/self._FPS:
                 time.sleep(1/self._FPS-dt)
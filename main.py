@@ -7,10 +7,19 @@ import RPi.GPIO as GPIO
 import asyncio
 import time
 import subprocess
+import sys
+import gc
+import memStats
 
 
 class Main(Logger):
-    def __init__(self):        
+    def __init__(self,compact=False):        
+        """
+        compact: for low memory boards, keep fewer log messages and freeze
+        objects created at startup out of the garbage collector.
+        """
+        if compact:
+            Logger.setMessageRingSize(20)
         fh = systemLogFile('system.log')
         self.fileHandler = fh
         super().__init__('main',fileHandler=fh)
@@ -23,13 +32,30 @@ class Main(Logger):
             Thread(name='mainLoopThread',target=self.mainLoop.run_forever,daemon=True).start()
 
 
-        # start modules
+        # start modules, LED first so it resumes the saved state before the network is up.
+        self.led = LEDControl(self)
+        self.led.start()
         self.client = ClientModule(self)        
         self.client.start()
         self.http = HttpServerModule(self)
         self.http.start()
-        self.led = LEDControl(self)
-        self.led.start()
+
+        if compact:
+            # startup objects live forever, don't scan them on every collection.
+            gc.collect()
+            gc.freeze()
+
+    def memoryReport(self,top=10,stop=False):
+        """
+        return RSS and top allocators, see memStats.memoryReport.
+        allocators need tracing from startup: python -X tracemalloc main.py,
+        stop=True ends tracing after this report.
+        """
+        report = memStats.memoryReport(top)
+        if stop:
+            memStats.stopTracing()
+        self.debug(f"Memory RSS {report['rss_kb']}kB, peak {report['peak_rss_kb']}kB")
+        return report
 
     def enableAP(self):
         "enable AP mode"
@@ -56,5 +82,5 @@ class Main(Logger):
 
 # /home/pi/hallowweenBucket/main.py
 if __name__ == '__main__':
-    main = Main()
+    main = Main(compact='-compact' in sys.argv)
     main.start()
\ No newline at end of file
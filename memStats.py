@@ -0,0 +1,46 @@
+"""
+Memory accounting: process RSS and top python allocators.
+"""
+import tracemalloc
+
+
+def rss():
+    "return (current RSS, peak RSS) of this process in kB."
+    current = peak = None
+    try:
+        with open('/proc/self/status', 'rt') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    current = int(line.split()[1])
+                elif line.startswith('VmHWM:'):
+                    peak = int(line.split()[1])
+    except OSError:
+        import resource
+        # ru_maxrss is kB on linux.
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return current, peak
+
+
+def memoryReport(top=10):
+    """
+    return {rss_kb, peak_rss_kb, tracing, traced_kb, top: [{where, size_kb, count}]}.
+    Allocators are only listed if tracing was enabled at startup, with
+    python -X tracemalloc main.py, tracing is never started here:
+    it slows down every allocation, the LED thread included.
+    """
+    current, peak = rss()
+    report = {'rss_kb': current, 'peak_rss_kb': peak, 'tracing': tracemalloc.is_tracing(),
+              'traced_kb': None, 'top': []}
+    if not tracemalloc.is_tracing():
+        return report
+    report['traced_kb'] = tracemalloc.get_traced_memory()[0] // 1024
+    for stat in tracemalloc.take_snapshot().statistics('lineno')[:int(top)]:
+        frame = stat.traceback[0]
+        report['top'].append({'where': f'{frame.filename}:{frame.lineno}',
+                              'size_kb': round(stat.size / 1024, 1), 'count': stat.count})
+    return report
+
+
+def stopTracing():
+    "stop tracemalloc, it costs memory and CPU while on."
+    tracemalloc.stop()
@@ -0,0 +1,165 @@
+"""
+Render a preview of every LED mode for the control page, run on a workstation:
+    python renderPreviews.py [--fps 24] [--duration 8] [--jobs N] [--force]
+Each mode runs against a simulated output in a process pool and is saved as a png
+frame strip in html/previews: one row per frame, one pixel per LED.
+Files are keyed by a hash of the mode's source and render settings, unchanged
+modes are not rendered again. html/previews/manifest.json lists the strips.
+"""
+import re
+import sys
+import json
+import zlib
+import struct
+import hashlib
+import inspect
+import logging
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import animation
+from ledControl import LEDControl, Frame, MODES
+
+PREVIEW_SEED = 1
+# change when the strip format changes, to render everything again.
+FORMAT_VERSION = 1
+OUTPUT = Path(__file__).parent / 'html' / 'previews'
+
+
+class SimulatedPixels():
+    "stand in for the TLC59711 driver, keeps the last values set."
+    def __init__(self):
+        self.values = {}
+
+    def set_pixel(self, index, value):
+        self.values[index] = tuple(value)
+
+    def show(self):
+        pass
+
+
+class HeadlessMain():
+    "what LEDControl needs from Main."
+    fileHandler = logging.NullHandler()
+
+
+def methodSource(name, seen=None):
+    "source of LEDControl.name and of the LEDControl methods it calls."
+    seen = set() if seen is None else seen
+    if name in seen or not callable(getattr(LEDControl, name, None)):
+        return ''
+    seen.add(name)
+    try:
+        source = inspect.getsource(getattr(LEDControl, name))
+    except (OSError, TypeError):
+        return ''
+    return source + ''.join(methodSource(i, seen) for i in re.findall(r'self\.(\w+)\(', source))
+
+
+def modeKey(mode, fps, duration):
+    "hash of everything that changes a mode's preview."
+    h = hashlib.sha1()
+    # class data modes read without calling a method: colors and LED counts.
+    data = [repr(getattr(LEDControl, i)) for i in ('_NAMED_COLOR', '_COLOR_NAMES', '_EYE_ORDER', '_RING_ORDER', '_ORDER')]
+    # previews go through renderFrame and Frame.fill, like the LED thread.
+    output = methodSource('renderFrame') + inspect.getsource(Frame)
+    for part in (methodSource(mode), *data, output, inspect.getsource(animation), fps, duration, PREVIEW_SEED, FORMAT_VERSION):
+        h.update(str(part).encode())
+    return h.hexdigest()[:12]
+
+
+def encodePNG(rows):
+    "encode rows of (r,g,b) 0 - 255 as an 8 bit rgb png."
+    height, width = len(rows), len(rows[0])
+    raw = b''.join(b'\x00' + bytes(min(255, max(0, int(v))) for color in row for v in color) for row in rows)
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(raw, 9))
+            + chunk(b'IEND', b''))
+
+
+def renderMode(mode, fps, duration):
+    "run mode for duration seconds at fps on simulated pixels, return frames or None if mode has no output."
+    pixels = SimulatedPixels()
+    led = LEDControl(HeadlessMain(), pixels=pixels, persist=False)
+    led._FPS = fps
+    led.brightness = 100
+    led.eyeGenerator = led.ringGenerator = None
+    # the mode starts at simulated time 0.
+    led.frameTime = 0
+    led.setMode(mode, PREVIEW_SEED)
+    if mode.startswith('eye'):
+        generator, order = led.eyeGenerator, led._EYE_ORDER
+    else:
+        generator, order = led.ringGenerator, led._RING_ORDER
+    if generator is None:
+        return None
+    frames = []
+    for i in range(int(duration * fps)):
+        # simulated clock, animations are sampled at the frame time.
+        led.renderFrame(i / fps)
+        # back from 16 bit driver values to 0 - 255.
+        frames.append([tuple(round(v * 255 / 65535) for v in pixels.values[p]) for p in order])
+    return frames
+
+
+def renderToFile(mode, fps, duration, path):
+    "worker: render mode into path, return (mode, frame count, led count) or None."
+    frames = renderMode(mode, fps, duration)
+    if frames is None:
+        return None
+    path.write_bytes(encodePNG(frames))
+    return mode, len(frames), len(frames[0])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render LED mode previews for the control page.')
+    parser.add_argument('--fps', type=int, default=24)
+    parser.add_argument('--duration', type=float, default=8, help='seconds of each preview')
+    parser.add_argument('--jobs', type=int, default=None, help='worker processes, default all cores')
+    parser.add_argument('--force', action='store_true', help='render unchanged modes again')
+    parser.add_argument('--out', type=Path, default=OUTPUT)
+    args = parser.parse_args(argv)
+    args.out.mkdir(parents=True, exist_ok=True)
+
+    manifestPath = args.out / 'manifest.json'
+    try:
+        old = json.loads(manifestPath.read_text())
+    except (OSError, ValueError):
+        old = {}
+    manifest = {}
+    jobs = {}
+    modes = dict.fromkeys(name for zone in ('eye', 'ring') for _, name in MODES[zone])
+    for mode in modes:
+        file = f'{mode}-{modeKey(mode, args.fps, args.duration)}.png'
+        if not args.force and (args.out / file).exists() and old.get(mode, {}).get('file') == file:
+            manifest[mode] = old[mode]
+        else:
+            jobs[mode] = file
+
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {mode: pool.submit(renderToFile, mode, args.fps, args.duration, args.out / file)
+                   for mode, file in jobs.items()}
+        for mode, future in futures.items():
+            result = future.result()
+            if result:
+                _, frames, leds = result
+                manifest[mode] = {'file': jobs[mode], 'fps': args.fps, 'frames': frames, 'leds': leds}
+
+    # remove strips of modes that changed or no longer exist.
+    current = {i['file'] for i in manifest.values()}
+    for png in args.out.glob('*.png'):
+        if png.name not in current:
+            png.unlink()
+    manifestPath.write_text(json.dumps(manifest, indent=1, sort_keys=True))
+    rendered = len([m for m in jobs if m in manifest])
+    print(f'Rendered {rendered} modes, {len(manifest) - rendered} unchanged, into {args.out}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""
+Persist a small json state to disk, so the bucket can resume after power cycle.
+Writes are debounced and atomic: the snapshot is written to a temp file,
+synced and then renamed over the old one, a power cut leaves either the
+old or the new snapshot.
+"""
+import os
+import json
+from pathlib import Path
+from threading import Timer, Lock
+
+
+class StateStore():
+    def __init__(self, path, debounce=2, logger=None):
+        self.path = Path(path)
+        self.debounce = debounce
+        self.logger = logger
+        self.lock = Lock()
+        self.pending = None
+        self.timer = None
+
+    def load(self):
+        "return saved state dict, or None if there is no valid snapshot."
+        try:
+            with open(self.path, 'rt') as f:
+                state = json.load(f)
+            return state if isinstance(state, dict) else None
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            if self.logger:
+                self.logger.error(f'Load state {self.path} error: {e}')
+            return None
+
+    def save(self, state):
+        "save state after debounce seconds, later calls in between replace it."
+        with self.lock:
+            self.pending = dict(state)
+            if self.timer is None:
+                self.timer = Timer(self.debounce, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        "write pending state now."
+        with self.lock:
+            state, self.pending = self.pending, None
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        if state is not None:
+            try:
+                self.write(state)
+            except (OSError, TypeError, ValueError) as e:
+                if self.logger:
+                    self.logger.error(f'Save state {self.path} error: {e}')
+
+    def write(self, state):
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp, 'wt') as f:
+            json.dump(state, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        # make the rename itself durable.
+        try:
+            fd = os.open(self.path.parent, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        except OSError:
+            pass
@@ -0,0 +1,71 @@
+import os
+import gzip
+
+import pytest
+
+from assetStore import Asset, AssetStore, acceptsGzip
+
+TEXT = b'<html>' + b'pumpkin ' * 200 + b'</html>'
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('gzip', True),
+    ('gzip, deflate, br', True),
+    ('*', True),
+    ('GZIP;q=0.5', True),
+    ('*;q=0, gzip', True),
+    ('gzip;q=0, *', False),
+    ('gzip;q=0', False),
+    ('identity', False),
+    ('gzip;q=x', False),
+    ('', False),
+    (None, False),
+])
+def test_acceptsGzip(header, expected):
+    assert acceptsGzip(header) is expected
+
+
+def test_keepsOneVariant():
+    text = Asset.fromBytes(TEXT, 0, 'text/html')
+    assert text.raw is None and gzip.decompress(text.gz) == TEXT
+    assert text.body('gzip') == (text.gz, 'gzip')
+    assert text.body('') == (TEXT, None)
+    small = Asset.fromBytes(b'x', 0, 'text/plain')
+    assert small.gz is None and small.gzEtag is None
+    assert small.body('gzip') == (b'x', None)
+
+
+def test_etagPerEncoding():
+    asset = Asset.fromBytes(TEXT, 0, 'text/html')
+    assert asset.gzEtag != asset.etag
+    assert asset.etagFor(asset.encoding('gzip')) == asset.gzEtag
+    assert asset.etagFor(asset.encoding('identity')) == asset.etag
+
+
+def test_notModified():
+    asset = Asset.fromBytes(TEXT, 1000000000, 'text/html')
+    assert asset.notModified(asset.etag)
+    assert asset.notModified(asset.gzEtag)
+    assert asset.notModified('"other", W/' + asset.etag)
+    assert asset.notModified('*')
+    assert not asset.notModified('"other"')
+    # If-None-Match wins over If-Modified-Since.
+    assert not asset.notModified('"other"', asset.lastModified)
+    assert asset.notModified(None, asset.lastModified)
+    assert not asset.notModified(None, 'Sat, 08 Sep 2001 01:46:39 GMT')
+    assert not asset.notModified(None, 'not a date')
+    assert not asset.notModified()
+
+
+def test_storeReloadsChangedFiles(tmp_path):
+    (tmp_path / 'a.js').write_bytes(TEXT)
+    (tmp_path / 'index.html').write_bytes(b'template')
+    store = AssetStore(tmp_path, checkInterval=0, exclude=['index.html'])
+    assert list(store.keys()) == ['a.js']
+    etag = store.get('a.js').etag
+    (tmp_path / 'a.js').write_bytes(b'x')
+    os.utime(tmp_path / 'a.js', ns=(0, 10 ** 9))
+    assert store.get('a.js').body('') == (b'x', None)
+    assert store.get('a.js').etag != etag
+    (tmp_path / 'a.js').unlink()
+    assert store.get('a.js') is None
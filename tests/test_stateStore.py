@@ -0,0 +1,22 @@
+import json
+
+from stateStore import StateStore
+
+
+def test_saveIsDebouncedAndAtomic(tmp_path):
+    store = StateStore(tmp_path / 'state.json', debounce=60)
+    assert store.load() is None
+    store.save({'brightness': 10})
+    store.save({'brightness': 20})
+    assert not store.path.exists()
+    store.flush()
+    assert store.load() == {'brightness': 20}
+    assert [p.name for p in tmp_path.iterdir()] == ['state.json']
+
+
+def test_loadIgnoresInvalidSnapshot(tmp_path):
+    path = tmp_path / 'state.json'
+    path.write_text('{"brightness": ')
+    assert StateStore(path).load() is None
+    path.write_text(json.dumps([1, 2]))
+    assert StateStore(path).load() is None
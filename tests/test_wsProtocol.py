@@ -0,0 +1,58 @@
+import pytest
+
+from ledControl import MODES
+from wsProtocol import (BinaryCodec, ProtocolError, OP_MODE, OP_BRIGHTNESS, OP_SUBSCRIBE, OP_UNSUBSCRIBE,
+                        OP_RESPONSE, STATUS_OK, STATUS_ERROR, modeIds)
+
+
+@pytest.fixture
+def codec():
+    return BinaryCodec(MODES)
+
+
+def test_modeIdsFollowRegistrationOrder():
+    ids = modeIds(MODES)
+    names = [name for zone in ('eye', 'ring') for _, name in MODES[zone]]
+    assert list(ids) == names
+    assert list(ids.values()) == list(range(len(names)))
+
+
+def test_decodeRequests(codec):
+    mode = codec.modeNames[-1]
+    assert codec.decode(codec.encodeMode(5, mode)) == (5, OP_MODE, {'action': 'led.show', 'mode': mode})
+    assert codec.decode(codec.encodeBrightness(6, 40)) == \
+        (6, OP_BRIGHTNESS, {'action': 'led.setBrightness', 'brightness': 40})
+    assert codec.decode(codec.encodeSubscribe(7, 'state')) == (7, OP_SUBSCRIBE, {'subscribe': 'state'})
+    assert codec.decode(codec.encodeSubscribe(8, 'state', False)) == (8, OP_UNSUBSCRIBE, {'unsubscribe': 'state'})
+
+
+@pytest.mark.parametrize('data', [
+    b'',
+    b'\x01',
+    bytes((0x7f, 1)),
+    bytes((OP_MODE, 1, 0xff, 0xff)),
+    bytes((OP_MODE, 1, 0)),
+    bytes((OP_BRIGHTNESS, 1, 50, 0)),
+    bytes((OP_SUBSCRIBE, 1, 200)),
+])
+def test_decodeRejectsBadMessages(codec, data):
+    with pytest.raises(ProtocolError):
+        codec.decode(data)
+
+
+def test_encodeResponse(codec):
+    assert codec.encodeResponse(3, OP_MODE, {'status': 'ok', 'data': 'ignored'}) == \
+        bytes((OP_RESPONSE, 3, OP_MODE, STATUS_OK))
+    assert codec.encodeResponse(4, OP_BRIGHTNESS, {'status': 'error', 'data': 'too bright'}) == \
+        bytes((OP_RESPONSE, 4, OP_BRIGHTNESS, STATUS_ERROR)) + b'too bright'
+
+
+def test_stateEventRoundTrip(codec):
+    state = {'eye': codec.modeNames[0], 'ring': codec.modeNames[-1], 'eyeSeed': 2 ** 32 - 1, 'ringSeed': None,
+             'brightness': 70, 'fullrandom': True, 'fullrandomDuration': 20.0, 'fps': 24.0}
+    event = codec.encodeEvent('state', state)
+    assert len(event) == 24
+    assert codec.decodeState(event) == state
+    # seeds that don't fit are sent as unset, missing modes as none.
+    state.update(eye=None, eyeSeed='abc', ringSeed=-1)
+    assert codec.decodeState(codec.encodeEvent('state', state)) == dict(state, eyeSeed=None, ringSeed=None)
@@ -0,0 +1,22 @@
+import wsServer
+from wsServer import TokenBucket
+
+
+class Clock():
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_tokenBucketBurstThenRate(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(wsServer.time, 'monotonic', clock)
+    bucket = TokenBucket(rate=10, burst=3)
+    assert [bucket.take() for _ in range(4)] == [True, True, True, False]
+    clock.now += 0.25
+    assert [bucket.take() for _ in range(3)] == [True, True, False]
+    # tokens don't pile up above burst.
+    clock.now += 60
+    assert sum(bucket.take() for _ in range(10)) == 3
@@ -0,0 +1,144 @@
+"""
+Compact binary websocket protocol, used alongside json.
+Client pick it during handshake with websocket subprotocol BINARY_PROTOCOL,
+clients asking for JSON_PROTOCOL or no subprotocol keep using json messages.
+
+All integers little endian.
+request:  opcode(B) seq(B) payload
+    OP_MODE        payload: mode id (H), index of the mode in MODES eye then ring order.
+    OP_BRIGHTNESS  payload: brightness 0 - 100 (B)
+    OP_SUBSCRIBE   payload: topic id (B), index in TOPICS
+    OP_UNSUBSCRIBE payload: topic id (B)
+response: OP_RESPONSE(B) seq(B) request opcode(B) status(B, 0 ok 1 error) + utf8 error message
+event:    OP_EVENT(B) topic id(B) payload, fixed layout per topic:
+    state  payload: eye mode id (H) ring mode id (H) brightness (B) flags (B)
+                    fps (f) fullrandom duration (f) eye seed (I) ring seed (I)
+           mode id NO_MODE if none, flags STATE_FULLRANDOM, STATE_EYE_SEED / STATE_RING_SEED
+           if that seed is set, a seed that isn't an unsigned 32 bit int is sent as not set.
+"""
+import struct
+
+BINARY_PROTOCOL = 'bucket.bin.v1'
+JSON_PROTOCOL = 'bucket.json'
+SUBPROTOCOLS = [BINARY_PROTOCOL, JSON_PROTOCOL]
+
+OP_MODE = 0x01
+OP_BRIGHTNESS = 0x02
+OP_SUBSCRIBE = 0x03
+OP_UNSUBSCRIBE = 0x04
+OP_RESPONSE = 0x80
+OP_EVENT = 0x81
+
+# topics published to subscribers, LEDControl publishes 'state' when it changes.
+TOPICS = ['state']
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+NO_MODE = 0xFFFF
+STATE_FULLRANDOM = 0x01
+STATE_EYE_SEED = 0x02
+STATE_RING_SEED = 0x04
+
+_HEADER = struct.Struct('<BB')
+_MODE = struct.Struct('<BBH')
+_BYTE_ARG = struct.Struct('<BBB')
+_RESPONSE = struct.Struct('<BBBB')
+_STATE = struct.Struct('<BBHHBBffII')
+
+
+class ProtocolError(ValueError):
+    "malformed binary message"
+
+
+def modeIds(modes):
+    "return {mode name: id} from MODES, ids follow eye then ring registration order."
+    ids = {}
+    for zone in ('eye', 'ring'):
+        for _, name in modes[zone]:
+            ids.setdefault(name, len(ids))
+    return ids
+
+
+class BinaryCodec():
+    "encode / decode binary messages, mode ids derived from a MODES dict."
+    def __init__(self, modes):
+        self.modeIds = modeIds(modes)
+        self.modeNames = list(self.modeIds)
+
+    def decode(self, data):
+        """
+        decode a request, return (seq, opcode, msg) where msg is the equivalent
+        json message {action:..., key:value}, or {'subscribe'/'unsubscribe': topic}.
+        """
+        if len(data) < _HEADER.size:
+            raise ProtocolError('Message too short.')
+        opcode, seq = _HEADER.unpack_from(data)
+        try:
+            if opcode == OP_MODE:
+                _, _, modeId = _MODE.unpack(data)
+                if modeId >= len(self.modeNames):
+                    raise ProtocolError(f'Unknown mode id {modeId}.')
+                return seq, opcode, {'action': 'led.show', 'mode': self.modeNames[modeId]}
+            if opcode == OP_BRIGHTNESS:
+                _, _, brightness = _BYTE_ARG.unpack(data)
+                return seq, opcode, {'action': 'led.setBrightness', 'brightness': brightness}
+            if opcode in (OP_SUBSCRIBE, OP_UNSUBSCRIBE):
+                _, _, topicId = _BYTE_ARG.unpack(data)
+                if topicId >= len(TOPICS):
+                    raise ProtocolError(f'Unknown topic id {topicId}.')
+                key = 'subscribe' if opcode == OP_SUBSCRIBE else 'unsubscribe'
+                return seq, opcode, {key: TOPICS[topicId]}
+        except struct.error as e:
+            raise ProtocolError(f'Bad payload for opcode {opcode}: {e}')
+        raise ProtocolError(f'Unknown opcode {opcode}.')
+
+    def encodeMode(self, seq, mode):
+        return _MODE.pack(OP_MODE, seq, self.modeIds[mode])
+
+    def encodeBrightness(self, seq, brightness):
+        return _BYTE_ARG.pack(OP_BRIGHTNESS, seq, brightness)
+
+    def encodeSubscribe(self, seq, topic, subscribe=True):
+        return _BYTE_ARG.pack(OP_SUBSCRIBE if subscribe else OP_UNSUBSCRIBE, seq, TOPICS.index(topic))
+
+    def encodeResponse(self, seq, opcode, response):
+        "encode a response dict {status, data, action}, only error messages are sent back."
+        if response.get('status') == 'ok':
+            return _RESPONSE.pack(OP_RESPONSE, seq, opcode, STATUS_OK)
+        return _RESPONSE.pack(OP_RESPONSE, seq, opcode, STATUS_ERROR) + str(response.get('data', '')).encode()
+
+    def encodeEvent(self, topic, data):
+        "encode an event of a topic in TOPICS."
+        if topic == 'state':
+            return self.encodeState(data)
+        raise ProtocolError(f'No binary layout for topic {topic}.')
+
+    def encodeState(self, state):
+        "encode a LEDControl.state() dict as a state event."
+        flags = STATE_FULLRANDOM if state.get('fullrandom') else 0
+        seeds = []
+        for zone, flag in (('eye', STATE_EYE_SEED), ('ring', STATE_RING_SEED)):
+            seed = state.get(zone + 'Seed')
+            if isinstance(seed, int) and 0 <= seed <= 0xFFFFFFFF:
+                flags |= flag
+                seeds.append(seed)
+            else:
+                seeds.append(0)
+        return _STATE.pack(OP_EVENT, TOPICS.index('state'),
+                           self.modeIds.get(state.get('eye'), NO_MODE), self.modeIds.get(state.get('ring'), NO_MODE),
+                           int(state.get('brightness', 0)), flags,
+                           float(state.get('fps', 0)), float(state.get('fullrandomDuration', 0)), *seeds)
+
+    def decodeState(self, data):
+        "decode a state event back to a state dict."
+        try:
+            _, _, eye, ring, brightness, flags, fps, duration, eyeSeed, ringSeed = _STATE.unpack(data)
+        except struct.error as e:
+            raise ProtocolError(f'Bad state event: {e}')
+        return {'eye': self.modeNames[eye] if eye < len(self.modeNames) else None,
+                'ring': self.modeNames[ring] if ring < len(self.modeNames) else None,
+                'eyeSeed': eyeSeed if flags & STATE_EYE_SEED else None,
+                'ringSeed': ringSeed if flags & STATE_RING_SEED else None,
+                'brightness': brightness, 'fullrandom': bool(flags & STATE_FULLRANDOM),
+                'fullrandomDuration': duration, 'fps': fps}
@@ -1,17 +1,18 @@
 """
 Tools to handle Raspberry Pi connection to clients.
 """
-import bluetooth
 import json
-import websockets
 import asyncio 
 from threading import Thread
 import socket
 import time
 from queue import Queue
-import requests
+from concurrent.futures import Future
+import inspect
 
 from Logger import Logger
+from ledControl import MODES
+from wsProtocol import BinaryCodec,ProtocolError,SUBPROTOCOLS,BINARY_PROTOCOL,TOPICS
 
 # TODO queue in connections
 # make client input and output queue, 
@@ -44,29 +45,69 @@ def get_ip():
 
 def internet_connected():
     try:
+        # only needed here, not loaded at startup.
+        import requests
         res = requests.get('https://www.google.com',timeout=3)
         return res.status_code==200
     except:
         return False
 
+# actions allowed in a batch: LED changes that LEDControl.restore can undo.
+BATCH_ACTIONS = ['led.show','led.setBrightness','led.setFPS','led.setFullRandom']
+
+class TokenBucket():
+    "allow rate messages per second on average, and bursts up to burst messages."
+    def __init__(self, rate=10, burst=20):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+
+    def take(self):
+        "return True if a message is allowed now."
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
 class WebsocketServer():
     """
     WebsocketServer listen to websocket connections.
-    Can only respond to incoming json serilized string.
+    Respond to json serilized string, or binary messages of wsProtocol
+    for clients negotiated the binary subprotocol.
+    Each client is rate limited by a token bucket, number of clients is capped,
+    and led.show commands for the same zone within a frame are merged, latest wins.
     """
-    def __init__(self, ip, port=8765, logger=None):
+    def __init__(self, ip, port=8765, logger=None, maxClients=16, rate=10, burst=20):
         "Start websocket server at ip:port"
         self.IP = ip
         self.port = port
         self.clients = set()
+        # client: set of subscribed topics
+        self.subscriptions = {}
         self.logger = logger
         self.websocketAddr = f"ws://{self.IP}:{self.port}"
         self.websocketServer = None
+        self.codec = BinaryCodec(MODES)
         self.Q = Queue()
+        self.maxClients = maxClients
+        self.rate = rate
+        self.burst = burst
+        # zone: (latest led.show message, flush timer) waiting for the next frame.
+        self.pendingShow = {}
+        self.stats = {'accepted':0,'dropped':0,'merged':0,'rejected':0}
 
-    def send(self,json_data):
-        "send a dictionary to clients"
-        self.Q.put_nowait(json.dumps(json_data, separators=(',', ':')))
+    def send(self,json_data,topic=None):
+        """
+        send a dictionary to clients.
+        without topic, send to all clients as json,
+        with topic, send to clients subscribed to it, encoded in the client's protocol.
+        """
+        self.Q.put_nowait((topic,json_data))
 
     def stopServer(self):
         "Disconnect all clients before exit."
@@ -86,44 +127,187 @@ class WebsocketServer():
         "return connected clients"
         return [i.remote_address for i in self.clients]
 
+    def getStats(self):
+        """
+        return message counters: accepted, dropped by rate limit,
+        merged into a later led.show, rejected connections.
+        """
+        return dict(self.stats,clients=len(self.clients))
+
     async def startServer(self):
         self.logger.debug(f'Started WebsocketServer on ws://{self.IP}:{self.port}')
         self.logger.websocketStatus = 'running'
+        # only needed once the server starts.
+        import websockets
         self.websocketServer = await websockets.server.serve(
-            self.ws_handler, self.IP, self.port, ping_interval=None
+            self.ws_handler, self.IP, self.port, ping_interval=None, subprotocols=SUBPROTOCOLS,
         ) 
     async def ws_handler(self, ws, uri):
         "Websocket connection handler."
+        if len(self.clients) >= self.maxClients:
+            self.stats['rejected'] += 1
+            self.logger.error(f'Websocket connection from {ws.remote_address} rejected, {len(self.clients)} clients connected.')
+            # 1013: try again later.
+            await ws.close(code=1013, reason='Too many clients.')
+            return
         self.clients.add(ws)
-        self.logger.debug(f'Websocket connection from {ws.remote_address}. Total clients: {len(self.clients)}.')
+        self.subscriptions[ws] = set()
+        bucket = TokenBucket(self.rate,self.burst)
+        self.logger.debug(f'Websocket connection from {ws.remote_address} ({ws.subprotocol or "json"}). Total clients: {len(self.clients)}.')
         try:
             async for msg in ws:
                 # self.logger.main.peripheral.led.show('wifi',[100,1],1,)
-                try:
-                    msg = json.loads(msg)
-                except json.decoder.JSONDecodeError:
-                    self.logger.error(
-                        f'Websocket Client {ws.remote_address} sent non-json message, msg: <{str(msg)[0:100]}>')
-                    await ws.send(json.dumps({'status': 'error', 'data': 'Message not json.'}, separators=(',', ':')))
+                if not bucket.take():
+                    self.stats['dropped'] += 1
                     continue
-                response = self.logger.messageHandler(msg) 
-
+                self.stats['accepted'] += 1
+                if isinstance(msg,bytes):
+                    response = await self.binaryHandler(ws,msg)
+                else:
+                    response = await self.jsonHandler(ws,msg)
                 if response:
-                    await ws.send(json.dumps(response, separators=(',', ':'))) 
+                    await ws.send(response) 
         except Exception as e:
             self.logger.error(
                 f'Websocket client {ws.remote_address} Exception: {e}')
         finally:
             self.clients.remove(ws)
+            self.subscriptions.pop(ws,None)
+
+    def subscribe(self,ws,msg):
+        "handle subscribe / unsubscribe message, return response dict or None if msg is not one."
+        for key in ('subscribe','unsubscribe'):
+            if key in msg:
+                topic = msg[key]
+                if topic not in TOPICS:
+                    return {'status':'error','data':f'Unknown topic {topic}.','action':key}
+                if key == 'subscribe':
+                    self.subscriptions[ws].add(topic)
+                else:
+                    self.subscriptions[ws].discard(topic)
+                return {'status':'ok','data':sorted(self.subscriptions[ws]),'action':key}
+        return None
+
+    def frameInterval(self):
+        "seconds per LED frame"
+        led = getattr(self.logger.main,'led',None)
+        return 1 / getattr(led,'_FPS',24)
+
+    def coalesceShow(self,msg):
+        """
+        queue a led.show message to run at the next frame, replacing a pending one for the same zone.
+        return response dict, or None if msg is not a led.show command.
+        """
+        mode = msg.get('mode')
+        if msg.get('action') != 'led.show' or not isinstance(mode,str) or set(msg) - {'action','mode','seed'}:
+            return None
+        if mode not in self.codec.modeIds:
+            return {'status':'error','data':f'LED mode {mode} not found','action':'led.show'}
+        zone = 'eye' if mode.startswith('eye') else 'ring'
+        pending = self.pendingShow.get(zone)
+        if pending:
+            self.stats['merged'] += 1
+            handle = pending[1]
+        else:
+            handle = asyncio.get_event_loop().call_later(self.frameInterval(),self.flushShow,zone)
+        self.pendingShow[zone] = (msg,handle)
+        return {'status':'ok','data':None,'action':'led.show'}
+
+    def flushShow(self,zone):
+        """
+        queue the latest led.show message of zone on the LED frame tasks, the same
+        queue batches use, so both apply in the order they were received.
+        return a Future of its response, or None if nothing is pending.
+        """
+        pending = self.pendingShow.pop(zone,None)
+        if not pending:
+            return None
+        msg,handle = pending
+        handle.cancel()
+
+        def show():
+            response = self.logger.messageHandler(msg)
+            if response.get('status') != 'ok':
+                self.logger.error(f"Deferred led.show {msg.get('mode')} error: {response.get('data')}")
+            return response
+        led = getattr(self.logger.main,'led',None)
+        if led is not None and led.is_alive():
+            return led.runAtFrame(show)
+        future = Future()
+        future.set_result(show())
+        return future
+
+    def flushPendingShows(self):
+        "queue every pending led.show of any client, return their Futures."
+        return [self.flushShow(zone) for zone in list(self.pendingShow)]
+
+    async def dispatch(self,ws,msg):
+        "run a decoded message, return response dict."
+        response = self.subscribe(ws,msg)
+        if response is None:
+            response = self.coalesceShow(msg)
+        if response is None:
+            # shows received earlier apply first: batches queue behind them,
+            # other commands run now, so wait for the shows to land.
+            shows = self.flushPendingShows()
+            if 'actions' not in msg:
+                for show in shows:
+                    await asyncio.wrap_future(show)
+            response = self.logger.messageHandler(msg) 
+        if isinstance(response,Future):
+            # batched actions are applied on the next LED frame.
+            response = await asyncio.wrap_future(response)
+        return response
+
+    async def jsonHandler(self,ws,msg):
+        "handle a json message, return encoded response."
+        try:
+            msg = json.loads(msg)
+        except json.decoder.JSONDecodeError:
+            self.logger.error(
+                f'Websocket Client {ws.remote_address} sent non-json message, msg: <{str(msg)[0:100]}>')
+            return json.dumps({'status': 'error', 'data': 'Message not json.'}, separators=(',', ':'))
+        response = await self.dispatch(ws,msg)
+        if response:
+            return json.dumps(response, separators=(',', ':'))
+
+    async def binaryHandler(self,ws,msg):
+        "handle a binary message, return encoded response."
+        try:
+            seq,opcode,msg = self.codec.decode(msg)
+        except ProtocolError as e:
+            self.logger.error(f'Websocket Client {ws.remote_address} sent bad binary message: {e}')
+            return self.codec.encodeResponse(msg[1] if len(msg) > 1 else 0, msg[0] if msg else 0,
+                                             {'status':'error','data':str(e)})
+        response = await self.dispatch(ws,msg)
+        return self.codec.encodeResponse(seq,opcode,response or {'status':'ok'})
+
+    def encodeBroadcast(self,topic,data):
+        "return [(client, message)] for a broadcast, each encoding done once."
+        if topic is None:
+            msg = json.dumps(data, separators=(',', ':'))
+            return [(client,msg) for client in self.clients]
+        encoded = {}
+        messages = []
+        for client in self.clients:
+            if topic not in self.subscriptions.get(client,()):
+                continue
+            binary = client.subprotocol == BINARY_PROTOCOL
+            if binary not in encoded:
+                encoded[binary] = self.codec.encodeEvent(topic,data) if binary else \
+                    json.dumps({'topic':topic,'data':data}, separators=(',', ':'))
+            messages.append((client,encoded[binary]))
+        return messages
 
     async def notify_clients(self):
         "notify clients with information Q data."
         while True:
             # send messages immediately. even if there is no clients.
             while not self.Q.empty():
-                msg = self.Q.get()                
-                if len(self.clients) > 0:                    
-                    await asyncio.wait([client.send(msg) for client in self.clients])
+                topic,data = self.Q.get()                
+                messages = self.encodeBroadcast(topic,data) if self.clients else []
+                if messages:                    
+                    await asyncio.wait([asyncio.ensure_future(client.send(msg)) for client,msg in messages])
             await asyncio.sleep(0.1)
 
 
@@ -162,6 +346,12 @@ class ClientModule(Thread,Logger):
     def stop(self):
         self.cleanUp()
 
+    def publish(self,topic,data):
+        "send data to clients subscribed to topic."
+        server = getattr(self,'websocketServer',None)
+        if server is not None:
+            server.send(data,topic=topic)
+
     def restartWebsocketServer(self):
         "restart websocket server"
         def restartWs():
@@ -188,6 +378,13 @@ class ClientModule(Thread,Logger):
             self.error(f'Stop websocket server error: {e}')
      
        
+    def resolveAction(self,action):
+        "follow action chain from main, return target or '__NON_EXISTING_MODULE__'."
+        target = self.main
+        for chain in action.split('.'):
+            target = getattr(target,chain.strip(),'__NON_EXISTING_MODULE__')
+        return target
+
     def messageHandler(self,msg):
         """
         handle message from clients
@@ -195,20 +392,24 @@ class ClientModule(Thread,Logger):
             action: moduleName.attr.attr, 
             other key:value pairs to pass to actuion function.
         }
+        or a batch: {
+            actions: [ {action:..., key:value}, ... ]
+        }
         return value format: {
             action: same as msg.
             status: 'error' or 'ok'.
             data: response. 
         }
+        for a batch, a Future of the combined response is returned, see batchHandler.
         """
+        if 'actions' in msg:
+            return self.batchHandler(msg['actions'])
         action = msg.pop('action',None) 
         self.debug(f'Received MSG {msg}')
         if not action:
             self.error(f"Client Invalid message {msg}")
             return {'status':'error', 'data': 'Invalid Message','action':action}
-        target = self.main
-        for chain in action.split('.'):
-            target = getattr(target,chain.strip(),'__NON_EXISTING_MODULE__')
+        target = self.resolveAction(action)
         try:
             if callable(target): 
                 try:
@@ -223,7 +424,73 @@ class ClientModule(Thread,Logger):
             self.error(f'Message handling error on <{action}>, msg:<{msg}>, error: {e}')
             return {'status':'error','data':str(e),'action':action}
 
-        
-    
-        
+    def validateAction(self,msg):
+        "return (target, kwargs) of one batch item, raise ValueError if it can't be applied."
+        if not isinstance(msg,dict) or not msg.get('action'):
+            raise ValueError(f'Invalid Message {msg}')
+        kwargs = {k:v for k,v in msg.items() if k != 'action'}
+        if msg['action'] not in BATCH_ACTIONS:
+            raise ValueError(f"{msg['action']} can't be batched, allowed: {', '.join(BATCH_ACTIONS)}.")
+        target = self.resolveAction(msg['action'])
+        if isinstance(target,str) and target == '__NON_EXISTING_MODULE__':
+            raise ValueError(f"Module {msg['action']} doesn't exist.")
+        if callable(target):
+            try:
+                inspect.signature(target).bind(**kwargs)
+            except TypeError as e:
+                raise ValueError(f"{msg['action']}: {e}")
+            except ValueError:
+                # builtins without signature, checked when called.
+                pass
+        return target,kwargs
+
+    def batchHandler(self,actions):
+        """
+        Validate a list of actions together, then apply them in order at the next
+        LED frame boundary, so the changes show up on the same frame.
+        If any action is invalid or fails, the remaining ones are skipped and the
+        LED state from before the batch is restored, so either all or none land.
+        Only BATCH_ACTIONS can be batched, and clients get one state event per batch.
+        return a Future of {status, action:'batch', data:[response of each action]}.
+        """
+        future = Future()
+        if not isinstance(actions,list) or not actions:
+            future.set_result({'status':'error','data':'actions must be a non empty list','action':'batch'})
+            return future
+        self.debug(f'Received batch {actions}')
+        try:
+            targets = [self.validateAction(msg) for msg in actions]
+        except ValueError as e:
+            self.error(f'Client invalid batch: {e}')
+            future.set_result({'status':'error','data':str(e),'action':'batch'})
+            return future
+        led = getattr(self.main,'led',None)
+
+        def apply():
+            snapshot = led.state()
+            results = []
+            # publish and save once for the whole batch, not each half applied step.
+            led.deferState = True
+            try:
+                for msg,(target,kwargs) in zip(actions,targets):
+                    if results and results[-1]['status'] != 'ok':
+                        results.append({'status':'error','data':'Skipped.','action':msg['action']})
+                        continue
+                    try:
+                        results.append({'status':'ok','data':target(**kwargs),'action':msg['action']})
+                    except Exception as e:
+                        self.error(f"Batch action <{msg['action']}> error: {e}")
+                        results.append({'status':'error','data':str(e),'action':msg['action']})
+            finally:
+                led.deferState = False
+            if all(r['status'] == 'ok' for r in results):
+                led.stateChanged()
+                return {'status':'ok','data':results,'action':'batch'}
+            # back to the state clients already have, nothing to publish.
+            led.restore(snapshot)
+            return {'status':'error','data':results,'action':'batch'}
 
+        if led is not None and led.is_alive():
+            return led.runAtFrame(apply)
+        future.set_result(apply())
+        return future